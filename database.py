@@ -2,42 +2,391 @@
 Database handler for storing events in JSON format.
 """
 
+import bisect
+import copy
+import gzip
 import json
 import os
+import threading
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from types import MappingProxyType
+from typing import Dict, List, Any, Mapping, Optional, Tuple
+
+from energy_calculator import parse_iso_timestamp
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _loads(data: str) -> Any:
+    """Deserialize JSON text, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dumps(data: Any, indent: bool = True) -> bytes:
+    """Serialize to JSON bytes, using orjson when available."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    return json.dumps(data, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
+
+
+# Known event fields, stored as slots instead of dict entries
+_EVENT_FIELDS = (
+    'event_id', 'event_type', 'timestamp_start_event', 'timestamp_end_event',
+    'duration_event', 'failure_probability', 'stored_at', '_start_epoch'
+)
+_EVENT_FIELD_SET = frozenset(_EVENT_FIELDS)
+
+_MISSING = object()
+
+
+@dataclass(slots=True)
+class Event:
+    """
+    Compact in-memory event record.
+
+    Slot storage is several times smaller than a dict with string keys. The
+    class exposes a small mapping-style interface (get / [] / in) so callers
+    that treat events as dicts keep working; keys outside the known fields
+    land in `extra`, which is only allocated when needed.
+    """
+    event_id: Any = None
+    event_type: Any = None
+    timestamp_start_event: Any = None
+    timestamp_end_event: Any = None
+    duration_event: Any = None
+    failure_probability: Any = None
+    stored_at: Any = None
+    _start_epoch: Any = None
+    extra: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Any]) -> 'Event':
+        """Build an Event from a plain event dictionary."""
+        event = cls()
+        for key, value in raw.items():
+            event[key] = value
+        return event
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert back to a plain dictionary for JSON serialization."""
+        result = {
+            field: getattr(self, field)
+            for field in _EVENT_FIELDS
+            if getattr(self, field) is not None
+        }
+        if self.extra:
+            result.update(self.extra)
+        return result
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in _EVENT_FIELD_SET:
+            value = getattr(self, key)
+            return default if value is None else value
+        if self.extra is not None:
+            return self.extra.get(key, default)
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        if key in _EVENT_FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        if key in _EVENT_FIELD_SET:
+            return getattr(self, key) is not None
+        return self.extra is not None and key in self.extra
 
 
 class Database:
     """Database handler for JSON file storage."""
-    
-    def __init__(self, database_path: str = "events_database.json"):
+
+    # Delay before a dirty in-memory state is flushed to disk, so bursts of
+    # mutations coalesce into a single write
+    FLUSH_DELAY_SECONDS = 0.5
+
+    def __init__(self, database_path: str = "events_database.json", sharded: bool = False):
         """
         Initialize database.
-        
+
         Args:
-            database_path: Path to JSON database file
+            database_path: Path to JSON database file, or to a shard directory
+                when sharded is True
+            sharded: Store one JSON file per resource type so saves only
+                rewrite the shards that changed
         """
         self.database_path = database_path
+        self.sharded = sharded
+        if sharded:
+            self.wal_path = os.path.join(database_path, 'events.wal')
+        else:
+            self.wal_path = database_path + '.wal'
+        self._wal = None
+        self._dirty = False
+        self._dirty_shards = set()
+        self._flush_timer = None
+        self._flush_lock = threading.Lock()
+        self._eid_index = {}
+        self._by_type = {}
         self.data = self._load_database()
-    
+
+    @staticmethod
+    def _shard_filename(resource_type: Optional[str]) -> str:
+        """File name of the shard holding resources of the given type."""
+        return f"events_{resource_type or 'unknown'}.json"
+
     def _load_database(self) -> Dict[str, Any]:
-        """Load database from JSON file."""
-        if os.path.exists(self.database_path):
+        """Load database from JSON file(s), replaying any pending WAL entries."""
+        if self.sharded:
+            data = self._load_shards()
+        else:
+            data = self._load_single_file(self.database_path)
+        # Hold events as compact slot records while in memory
+        for resource_data in data.values():
+            resource_data['events'] = [
+                Event.from_dict(e) if isinstance(e, dict) else e
+                for e in resource_data.get('events', [])
+            ]
+        self._build_indexes(data)
+        self._replay_wal(data)
+        return data
+
+    @staticmethod
+    def _load_single_file(path: str) -> Dict[str, Any]:
+        """Load one JSON file (gzip-compressed if named *.gz), returning an
+        empty dict on any error."""
+        if os.path.exists(path):
             try:
-                with open(self.database_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, IOError):
+                with open(path, 'rb') as f:
+                    payload = f.read()
+                if path.endswith('.gz'):
+                    payload = gzip.decompress(payload)
+                return _loads(payload)
+            except (ValueError, IOError):
                 return {}
         return {}
-    
-    def save(self):
-        """Save database to JSON file."""
+
+    def _load_shards(self) -> Dict[str, Any]:
+        """Load all per-type shard files from the shard directory."""
+        # Auto-migrate a legacy single-file database into shards. The legacy
+        # file is renamed aside so the directory can take its path, every
+        # shard is written through _atomic_write, and only then is the
+        # legacy copy deleted — at no point is the data absent from disk,
+        # and a crash mid-migration resumes from the renamed file
+        legacy_path = self.database_path + '.legacy'
+        if os.path.isfile(self.database_path):
+            os.replace(self.database_path, legacy_path)
+        if os.path.isfile(legacy_path):
+            legacy = self._load_single_file(legacy_path)
+            os.makedirs(self.database_path, exist_ok=True)
+            shards = {}
+            for resource_id, resource_data in legacy.items():
+                shards.setdefault(resource_data.get('type'), {})[resource_id] = resource_data
+            for resource_type, shard in shards.items():
+                self._atomic_write(
+                    os.path.join(self.database_path, self._shard_filename(resource_type)),
+                    _dumps(shard)
+                )
+            os.remove(legacy_path)
+            return legacy
+
+        data = {}
+        if os.path.isdir(self.database_path):
+            for name in sorted(os.listdir(self.database_path)):
+                if name.startswith('events_') and name.endswith('.json'):
+                    data.update(self._load_single_file(os.path.join(self.database_path, name)))
+        else:
+            os.makedirs(self.database_path, exist_ok=True)
+        return data
+
+    def _build_indexes(self, data: Dict[str, Any]):
+        """Build event_id and resource-type indexes in one pass over loaded data."""
+        self._eid_index = {
+            resource_id: {
+                e.get('event_id'): i
+                for i, e in enumerate(resource_data.get('events', []))
+            }
+            for resource_id, resource_data in data.items()
+        }
+        # Sorted per-type resource-id lists: deterministic iteration order and
+        # O(log N) membership via bisect
+        self._by_type = {}
+        for resource_id, resource_data in data.items():
+            self._by_type.setdefault(resource_data.get('type'), []).append(resource_id)
+        for resource_ids in self._by_type.values():
+            resource_ids.sort()
+
+    def _replay_wal(self, data: Dict[str, Any]):
+        """Apply events from the write-ahead log onto loaded data."""
+        if not os.path.exists(self.wal_path):
+            return
+        try:
+            with open(self.wal_path, 'rb') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = _loads(line)
+                    except ValueError:
+                        # Skip truncated/corrupt trailing record
+                        continue
+                    self._apply_event(
+                        data, record['resource_id'], record['resource_type'], record['event']
+                    )
+        except IOError:
+            pass
+
+    def _wal_append(self, resource_id: str, resource_type: str, event: Dict[str, Any]):
+        """Append an event record to the write-ahead log."""
+        if self._wal is None:
+            try:
+                self._wal = open(self.wal_path, 'ab', buffering=1 << 20)
+            except IOError as e:
+                print(f"Error opening WAL: {e}")
+                return
+        record = {
+            'resource_id': resource_id,
+            'resource_type': resource_type,
+            'event': event
+        }
+        self._wal.write(_dumps(record, indent=False) + b'\n')
+
+    def _mark_dirty(self):
+        """Flag in-memory state as dirty and (re)schedule a debounced flush."""
+        self._dirty = True
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        self._flush_timer = threading.Timer(self.FLUSH_DELAY_SECONDS, self._flush)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+
+    def _flush(self):
+        """Write dirty state to disk (called from the debounce timer)."""
+        with self._flush_lock:
+            if self._dirty:
+                self._write_snapshot()
+                self._dirty = False
+
+    def save(self, pretty: bool = False):
+        """
+        Save database to JSON file synchronously and truncate the WAL.
+
+        Args:
+            pretty: Indent the output for human inspection; the canonical
+                file is written compact since indentation bloats it ~30%
+        """
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        with self._flush_lock:
+            self._write_snapshot(pretty=pretty)
+            self._dirty = False
+
+    def pretty_save(self):
+        """Save with indented output (debugging helper)."""
+        self.save(pretty=True)
+
+    def close(self):
+        """Flush any pending state and release the WAL handle."""
+        self.save()
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_snapshot(self, pretty: bool = False):
+        """Atomically write the consolidated JSON snapshot and truncate the WAL."""
         try:
-            with open(self.database_path, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, indent=2, ensure_ascii=False)
-        except IOError as e:
+            if self._wal is not None:
+                self._wal.flush()
+                os.fsync(self._wal.fileno())
+            if self.sharded:
+                # Only rewrite shards whose resources were touched
+                for resource_type in self._dirty_shards:
+                    shard = self._serializable({
+                        resource_id: self.data[resource_id]
+                        for resource_id in self._by_type.get(resource_type, ())
+                    })
+                    self._atomic_write(
+                        os.path.join(self.database_path, self._shard_filename(resource_type)),
+                        _dumps(shard, indent=pretty)
+                    )
+                self._dirty_shards.clear()
+            else:
+                payload = _dumps(self._serializable(self.data), indent=pretty)
+                if self.database_path.endswith('.gz'):
+                    # Fewer bytes through write+fsync; level 3 keeps the
+                    # compression cost well below the saved I/O
+                    payload = gzip.compress(payload, compresslevel=3)
+                self._atomic_write(self.database_path, payload)
+            # Consolidated snapshot written; pending WAL entries are now redundant
+            if self._wal is not None:
+                self._wal.close()
+                self._wal = None
+            if os.path.exists(self.wal_path):
+                os.remove(self.wal_path)
+        except Exception as e:
+            # Broad on purpose: this also runs on the debounce timer thread,
+            # where an uncaught error would kill the thread and silently
+            # drop the flush
             print(f"Error saving database: {e}")
+
+    @staticmethod
+    def _serializable(data: Dict[str, Any]) -> Dict[str, Any]:
+        """Expand Event records back to plain dicts for JSON output."""
+        return {
+            resource_id: {
+                **resource_data,
+                'events': [
+                    e.to_dict() if isinstance(e, Event) else e
+                    for e in resource_data.get('events', [])
+                ]
+            }
+            for resource_id, resource_data in data.items()
+        }
+
+    @staticmethod
+    def _atomic_write(path: str, payload: bytes):
+        """Write bytes to a temp file and rename over the target so a crash
+        mid-write cannot corrupt the existing file."""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb', buffering=1 << 20) as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def __del__(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        if self._wal is not None:
+            try:
+                self._wal.close()
+            except Exception:
+                pass
     
     def add_event(self, resource_id: str, resource_type: str, event: Dict[str, Any]):
         """
@@ -48,44 +397,105 @@ class Database:
             resource_type: Type of resource
             event: Event data dictionary
         """
-        if resource_id not in self.data:
-            self.data[resource_id] = {
+        if isinstance(event, dict):
+            event = Event.from_dict(event)
+        # The debounced flush serializes self.data and recycles the WAL
+        # handle from a timer thread, so mutation and WAL append must hold
+        # the same lock it takes
+        with self._flush_lock:
+            self._apply_event(self.data, resource_id, resource_type, event)
+            self._wal_append(resource_id, resource_type, event.to_dict())
+        self._mark_dirty()
+
+    def add_events_bulk(self, items: List[Tuple[str, str, Dict[str, Any]]]):
+        """
+        Add many events in one batch.
+
+        Applies every event in memory and appends them to the WAL before
+        scheduling a single flush, so a batch of N inserts costs one dirty
+        mark instead of N timer reschedules.
+
+        Args:
+            items: List of (resource_id, resource_type, event) tuples
+        """
+        if not items:
+            return
+        # Same locking as add_event: keep the flush timer from serializing
+        # self.data mid-batch
+        with self._flush_lock:
+            for resource_id, resource_type, event in items:
+                if isinstance(event, dict):
+                    event = Event.from_dict(event)
+                self._apply_event(self.data, resource_id, resource_type, event)
+                self._wal_append(resource_id, resource_type, event.to_dict())
+        self._mark_dirty()
+
+    def _apply_event(self, data: Dict[str, Any], resource_id: str, resource_type: str, event: Any):
+        """Apply an event to the in-memory data (shared by add_event and WAL replay)."""
+        if isinstance(event, dict):
+            event = Event.from_dict(event)
+
+        # Compute the timestamp once per call instead of per field
+        now_iso = datetime.now().isoformat()
+
+        if resource_id not in data:
+            data[resource_id] = {
                 'type': resource_type,
                 'events': [],
-                'created_at': datetime.now().isoformat(),
-                'updated_at': datetime.now().isoformat()
+                'created_at': now_iso,
+                'updated_at': now_iso
             }
-        
+            bisect.insort(self._by_type.setdefault(resource_type, []), resource_id)
+
+        self._dirty_shards.add(resource_type)
+
         # Add timestamp if not present
         if 'stored_at' not in event:
-            event['stored_at'] = datetime.now().isoformat()
-        
-        # Check if event already exists (by event_id)
+            event['stored_at'] = now_iso
+
+        # Precompute epoch seconds of the event start so period filters can
+        # do an integer compare instead of re-parsing the ISO string
+        if '_start_epoch' not in event:
+            timestamp_start = event.get('timestamp_start_event')
+            if timestamp_start:
+                try:
+                    event['_start_epoch'] = parse_iso_timestamp(timestamp_start).timestamp()
+                except (ValueError, TypeError):
+                    pass
+
         event_id = event.get('event_id')
-        existing_events = self.data[resource_id]['events']
-        
-        # Check if event with same ID already exists
-        event_exists = any(e.get('event_id') == event_id for e in existing_events)
-        
-        if not event_exists:
-            self.data[resource_id]['events'].append(event)
-            self.data[resource_id]['updated_at'] = datetime.now().isoformat()
+        existing_events = data[resource_id]['events']
+
+        # O(1) existence check / replace via the per-resource event_id index
+        eid_index = self._eid_index.setdefault(resource_id, {})
+        idx = eid_index.get(event_id)
+
+        if idx is None:
+            existing_events.append(event)
+            eid_index[event_id] = len(existing_events) - 1
         else:
             # Update existing event
-            for i, e in enumerate(existing_events):
-                if e.get('event_id') == event_id:
-                    existing_events[i] = event
-                    self.data[resource_id]['updated_at'] = datetime.now().isoformat()
-                    break
+            existing_events[idx] = event
+        data[resource_id]['updated_at'] = now_iso
     
-    def get_all_events(self) -> Dict[str, Any]:
+    def get_all_events(self) -> Mapping[str, Any]:
         """
         Get all events from database.
-        
+
+        Returns:
+            Read-only view of all events (no copy is made; use snapshot()
+            for a mutable copy)
+        """
+        return MappingProxyType(self.data)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get a deep, mutable copy of all events.
+
         Returns:
-            Dictionary with all events
+            Independent dictionary with all events
         """
-        return self.data.copy()
+        return copy.deepcopy(self.data)
     
     def get_resource_events(self, resource_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -99,6 +509,48 @@ class Database:
         """
         return self.data.get(resource_id)
     
+    def get_events_in_range(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+        """
+        Get events whose start timestamp falls within [start_date, end_date].
+
+        Uses the _start_epoch precomputed at ingest, so the filter is an
+        integer compare per event; legacy events without it are parsed once
+        and backfilled.
+
+        Args:
+            start_date: Start of the period (inclusive)
+            end_date: End of the period (inclusive)
+
+        Returns:
+            Dictionary of resources restricted to their in-range events;
+            resources with no in-range events are omitted
+        """
+        start_epoch = start_date.timestamp()
+        end_epoch = end_date.timestamp()
+
+        filtered = {}
+        for resource_id, resource_data in self.data.items():
+            in_range = []
+            for event in resource_data.get('events', []):
+                epoch = event.get('_start_epoch')
+                if epoch is None:
+                    timestamp_start = event.get('timestamp_start_event')
+                    if not timestamp_start:
+                        continue
+                    try:
+                        epoch = parse_iso_timestamp(timestamp_start).timestamp()
+                    except (ValueError, TypeError):
+                        continue
+                    event['_start_epoch'] = epoch
+                if start_epoch <= epoch <= end_epoch:
+                    in_range.append(event)
+            if in_range:
+                filtered[resource_id] = {
+                    'type': resource_data.get('type'),
+                    'events': in_range
+                }
+        return filtered
+
     def get_events_by_type(self, resource_type: str) -> Dict[str, Any]:
         """
         Get all events for a specific resource type.
@@ -109,8 +561,7 @@ class Database:
         Returns:
             Dictionary with events filtered by type
         """
-        filtered = {}
-        for resource_id, resource_data in self.data.items():
-            if resource_data.get('type') == resource_type:
-                filtered[resource_id] = resource_data
-        return filtered
+        return {
+            resource_id: self.data[resource_id]
+            for resource_id in self._by_type.get(resource_type, ())
+        }
@@ -1,11 +1,86 @@
 """
 Energy consumption calculator for IT resources.
+
+Performance note: base-energy computation is closed-form O(1) per
+(type, period) and event adjustments reduce over flat columns, so there is
+no per-hour numeric kernel left that would benefit from JIT compilation.
 """
 
+from collections import defaultdict
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Dict, List, Any
 import math
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from ciso8601 import parse_datetime as _parse_datetime_c
+except ImportError:
+    _parse_datetime_c = None
+
+# Batches smaller than this are cheaper to sum in pure Python
+_VECTORIZE_MIN_EVENTS = 32
+
+# Effect of an event on energy while it lasts, as a multiplier on base power:
+# stops/failures cut consumption, overloads and updates raise it
+_EVENT_TYPE_FACTOR = {
+    'hardware_maintenance_stop': -1.0,
+    'software_maintenance_stop': -1.0,
+    'hardware_failure': -1.0,
+    'operating_system_failure': -1.0,
+    'software_service_failure': -1.0,
+    'cpu_overflow': 0.25,
+    'cpu_overload': 0.25,
+    'software_update': 0.1,
+    'operating_system_update': 0.1,
+}
+
+
+def _event_factor(event_type: str) -> float:
+    """Look up the energy factor for an event type (0.0 means no effect)."""
+    factor = _EVENT_TYPE_FACTOR.get(event_type)
+    if factor is None:
+        # Unknown type: classify once via the substring heuristics, then cache
+        if 'maintenance_stop' in event_type or 'failure' in event_type:
+            factor = -1.0
+        elif 'update' in event_type:
+            factor = 0.1
+        else:
+            factor = 0.0
+        _EVENT_TYPE_FACTOR[event_type] = factor
+    return factor
+
+
+def parse_iso_timestamp(timestamp: str) -> datetime:
+    """
+    Parse an ISO format timestamp (with or without timezone) to a naive datetime.
+
+    Uses the ciso8601 C parser when available; falls back to
+    datetime.fromisoformat with 'Z'-suffix normalization.
+
+    Args:
+        timestamp: ISO format timestamp string
+
+    Returns:
+        Naive datetime (timezone info stripped)
+
+    Raises:
+        ValueError, TypeError: If the timestamp cannot be parsed
+    """
+    if _parse_datetime_c is not None:
+        parsed = _parse_datetime_c(timestamp)
+    else:
+        if timestamp.endswith('Z'):
+            timestamp = timestamp[:-1] + '+00:00'
+        parsed = datetime.fromisoformat(timestamp)
+    if parsed.tzinfo:
+        parsed = parsed.replace(tzinfo=None)
+    return parsed
+
 
 class EnergyCalculator:
     """Calculator for energy consumption of IT resources."""
@@ -42,7 +117,50 @@ class EnergyCalculator:
     
     def __init__(self):
         """Initialize energy calculator."""
-        pass
+        self._power_per_hour = self._build_hourly_power_table()
+        # Cumulative energy from midnight up to each hour boundary, per type
+        self._cum_power_per_hour = {
+            resource_type: self._cumulative(hourly)
+            for resource_type, hourly in self._power_per_hour.items()
+        }
+        # Memoize per (resource_type, start_date, end_date): callers repeat the
+        # same period for every resource of a type
+        self._calculate_base_energy = lru_cache(maxsize=64)(self._calculate_base_energy)
+
+    @staticmethod
+    def _cumulative(hourly: tuple) -> tuple:
+        """Build a 25-entry running sum of an hourly power table."""
+        sums = [0.0]
+        for power in hourly:
+            sums.append(sums[-1] + power)
+        return tuple(sums)
+
+    def _energy_from_midnight(self, resource_type: str, moment: datetime) -> float:
+        """Energy (Wh) consumed from midnight of the given day up to `moment`."""
+        hourly = self._power_per_hour[resource_type]
+        fraction = (moment.minute * 60 + moment.second + moment.microsecond / 1e6) / 3600
+        return self._cum_power_per_hour[resource_type][moment.hour] + hourly[moment.hour] * fraction
+
+    @classmethod
+    def _build_hourly_power_table(cls) -> Dict[str, tuple]:
+        """
+        Precompute a 24-entry power lookup table per resource type.
+
+        Returns:
+            Dictionary mapping resource type to a tuple of watts per hour of day
+        """
+        table = {}
+        for resource_type, powers in cls.POWER_CONSUMPTION.items():
+            if 'always' in powers:
+                table[resource_type] = (powers['always'],) * 24
+            else:
+                table[resource_type] = tuple(
+                    powers['production']
+                    if cls.PRODUCTION_START_HOUR <= hour < cls.PRODUCTION_END_HOUR
+                    else powers['night']
+                    for hour in range(24)
+                )
+        return table
     
     def calculate_weekly_energy(self, events_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -69,13 +187,12 @@ class EnergyCalculator:
         
         # Track resources and their states
         resources = {}
-        
-        # Create a map of resource IDs to their data
-        resource_map = {}
+
+        # Group resources by type in a single pass
+        by_type = defaultdict(list)
         for resource_id, resource_data in events_data.items():
-            resource_type = resource_data.get('type')
-            resource_map[resource_id] = resource_data
-        
+            by_type[resource_data.get('type')].append((resource_id, resource_data))
+
         # Calculate energy for ALL resources in production
         for resource_type, count in self.PRODUCTION_INVENTORY.items():
             # Calculate base energy per resource of this type
@@ -88,25 +205,24 @@ class EnergyCalculator:
             total_adjusted_energy = total_base_energy
             resources_with_events = 0
             
-            for resource_id, resource_data in events_data.items():
-                if resource_data.get('type') == resource_type:
-                    resource_events = resource_data.get('events', [])
-                    # Adjust energy for this specific resource
-                    adjusted_energy = self._adjust_energy_for_events(
-                        base_energy_per_resource, resource_type, resource_events, start_date, end_date
-                    )
-                    
-                    # Calculate difference from base
-                    energy_delta = adjusted_energy - base_energy_per_resource
-                    total_adjusted_energy += energy_delta
-                    
-                    resources[resource_id] = {
-                        'type': resource_type,
-                        'base_energy_wh': base_energy_per_resource,
-                        'adjusted_energy_wh': adjusted_energy,
-                        'events_count': len(resource_events)
-                    }
-                    resources_with_events += 1
+            for resource_id, resource_data in by_type.get(resource_type, ()):
+                resource_events = resource_data.get('events', [])
+                # Adjust energy for this specific resource
+                adjusted_energy = self._adjust_energy_for_events(
+                    base_energy_per_resource, resource_type, resource_events, start_date, end_date
+                )
+
+                # Calculate difference from base
+                energy_delta = adjusted_energy - base_energy_per_resource
+                total_adjusted_energy += energy_delta
+
+                resources[resource_id] = {
+                    'type': resource_type,
+                    'base_energy_wh': base_energy_per_resource,
+                    'adjusted_energy_wh': adjusted_energy,
+                    'events_count': len(resource_events)
+                }
+                resources_with_events += 1
             
             # For resources without events, use base energy
             resources_without_events = count - resources_with_events
@@ -146,34 +262,18 @@ class EnergyCalculator:
             # Always on: 50W * hours
             hours = (end_date - start_date).total_seconds() / 3600
             return self.POWER_CONSUMPTION['internet_gateway']['always'] * hours
-        
-        # For other resources, calculate production vs night time
-        total_hours = (end_date - start_date).total_seconds() / 3600
-        energy = 0
-        
-        current = start_date
-        while current < end_date:
-            hour = current.hour
-            
-            # Determine if production or night time
-            if self.PRODUCTION_START_HOUR <= hour < self.PRODUCTION_END_HOUR:
-                # Production time
-                power = self.POWER_CONSUMPTION[resource_type]['production']
-            else:
-                # Night time
-                power = self.POWER_CONSUMPTION[resource_type]['night']
-            
-            # Calculate energy for this hour (or partial hour)
-            next_hour = (current.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1))
-            if next_hour > end_date:
-                next_hour = end_date
-            
-            hours = (next_hour - current).total_seconds() / 3600
-            energy += power * hours
-            
-            current = next_hour
-        
-        return energy
+
+        if end_date <= start_date:
+            return 0.0
+
+        # Closed form: whole calendar days at the constant daily total, with
+        # the ragged edges resolved analytically from the cumulative table
+        daily_energy = self._cum_power_per_hour[resource_type][24]
+        days_between = (end_date.date() - start_date.date()).days
+
+        return (daily_energy * days_between
+                + self._energy_from_midnight(resource_type, end_date)
+                - self._energy_from_midnight(resource_type, start_date))
     
     def _adjust_energy_for_events(self, base_energy: float, resource_type: str, 
                                    events: List[Dict], start_date: datetime, end_date: datetime) -> float:
@@ -190,74 +290,75 @@ class EnergyCalculator:
         Returns:
             Adjusted energy consumption in watt-hours
         """
-        adjusted_energy = base_energy
-        
+        hourly = self._power_per_hour[resource_type]
+
+        # Period bounds as epoch seconds for the cheap pre-parse filter
+        period_start_epoch = start_date.timestamp()
+        period_end_epoch = end_date.timestamp()
+
+        # Parse events once into flat columns (power, duration, factor)
+        powers = []
+        durations = []
+        factors = []
+
         for event in events:
+            # Short-circuit on the precomputed epoch before any string parsing
+            start_epoch = event.get('_start_epoch')
+            if start_epoch is not None and not (period_start_epoch <= start_epoch <= period_end_epoch):
+                continue
+
             event_type = event.get('event_type', '')
             duration_str = event.get('duration_event', '0')
-            
+
             try:
                 duration_seconds = int(float(duration_str))
             except (ValueError, TypeError):
                 continue
-            
+
             duration_hours = duration_seconds / 3600.0
-            
+
             # Get event timestamps
             try:
                 timestamp_start_str = event.get('timestamp_start_event', '')
                 timestamp_end_str = event.get('timestamp_end_event', '')
-                
+
                 if not timestamp_start_str:
                     continue
-                
-                # Handle ISO format with or without timezone
-                if timestamp_start_str.endswith('Z'):
-                    timestamp_start_str = timestamp_start_str[:-1] + '+00:00'
-                event_start = datetime.fromisoformat(timestamp_start_str.replace('Z', '+00:00'))
-                
-                # Remove timezone for comparison if present
-                if event_start.tzinfo:
-                    event_start = event_start.replace(tzinfo=None)
-                
+
+                event_start = parse_iso_timestamp(timestamp_start_str)
+
                 if timestamp_end_str:
-                    if timestamp_end_str.endswith('Z'):
-                        timestamp_end_str = timestamp_end_str[:-1] + '+00:00'
-                    event_end = datetime.fromisoformat(timestamp_end_str.replace('Z', '+00:00'))
-                    if event_end.tzinfo:
-                        event_end = event_end.replace(tzinfo=None)
+                    event_end = parse_iso_timestamp(timestamp_end_str)
                 else:
                     event_end = event_start
             except (ValueError, TypeError):
                 continue
-            
-            # Only consider events within the period
-            if event_start < start_date or event_start > end_date:
+
+            if start_epoch is None:
+                # Legacy event without the precomputed field: check the window
+                # the slow way and store the epoch back for next time
+                if event_start < start_date or event_start > end_date:
+                    continue
+                try:
+                    event['_start_epoch'] = event_start.timestamp()
+                except TypeError:
+                    pass
+
+            # Classify event effect on power draw with one dict lookup
+            factor = _event_factor(event_type)
+            if factor == 0.0:
                 continue
-            
-            # Calculate power consumption during event
-            if resource_type == 'internet_gateway':
-                power_during_event = self.POWER_CONSUMPTION['internet_gateway']['always']
-            else:
-                # Determine if event occurred during production or night time
-                hour = event_start.hour
-                if self.PRODUCTION_START_HOUR <= hour < self.PRODUCTION_END_HOUR:
-                    power_during_event = self.POWER_CONSUMPTION[resource_type]['production']
-                else:
-                    power_during_event = self.POWER_CONSUMPTION[resource_type]['night']
-            
-            # Adjust energy based on event type
-            if 'maintenance_stop' in event_type or 'failure' in event_type:
-                # Resource is stopped, no energy consumption during event
-                energy_saved = power_during_event * duration_hours
-                adjusted_energy -= energy_saved
-            elif event_type == 'cpu_overflow' or event_type == 'cpu_overload':
-                # CPU overload may increase energy consumption by 20-30%
-                energy_increase = power_during_event * duration_hours * 0.25
-                adjusted_energy += energy_increase
-            elif 'update' in event_type:
-                # Updates may slightly increase energy consumption
-                energy_increase = power_during_event * duration_hours * 0.1
-                adjusted_energy += energy_increase
-        
-        return max(0, adjusted_energy)  # Energy cannot be negative
+
+            powers.append(hourly[event_start.hour])
+            durations.append(duration_hours)
+            factors.append(factor)
+
+        # Aggregate deltas in one vectorized pass when the batch is large
+        if np is not None and len(powers) >= _VECTORIZE_MIN_EVENTS:
+            delta = float(np.multiply(
+                np.array(powers) * np.array(durations), np.array(factors)
+            ).sum())
+        else:
+            delta = sum(p * d * f for p, d, f in zip(powers, durations, factors))
+
+        return max(0, base_energy + delta)  # Energy cannot be negative
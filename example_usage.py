@@ -27,8 +27,9 @@ def main():
     if os.path.exists(input_file):
         processor.process_input_file(input_file)
         
-        # Generate CO2 report
-        report = processor.generate_co2_report("CO2_emission_report.json")
+        # Build the CO2 report in memory, then write it to disk
+        report = processor.build_co2_report()
+        processor.write_co2_report(report, "CO2_emission_report.json")
         
         print("\n" + "="*50)
         print("Report Summary:")
@@ -2,64 +2,400 @@
 LLM service for OpenRouter API integration.
 """
 
+import hashlib
+import heapq
 import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, Any, Optional, List
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Markdown code fences wrapping LLM JSON output
+_JSON_FENCE = re.compile(r'^\s*```(?:json)?\s*\n?|\n?\s*```\s*$')
+
+# Failure probability by event type, used both as the fallback when the LLM
+# response cannot be parsed and as the direct answer for deterministic types
+_SEVERITY_MAP = {
+    'hardware_failure': 0.9,
+    'operating_system_failure': 0.8,
+    'software_service_failure': 0.6,
+    'cpu_overflow': 0.5,
+    'hardware_maintenance_stop': 0.2,
+    'software_maintenance_stop': 0.1,
+    'software_update': 0.1,
+    'operating_system_update': 0.2
+}
+
+# Planned maintenance and updates carry no diagnostic signal worth an LLM
+# round-trip; their probability is answered directly from the severity map
+_DETERMINISTIC_EVENT_TYPES = {
+    'hardware_maintenance_stop',
+    'software_maintenance_stop',
+    'software_update',
+    'operating_system_update',
+}
+
+
+def _prompt_json(data: Any) -> str:
+    """Serialize data for embedding in a prompt: compact JSON, no
+    indentation — indentation only adds tokens, not meaning."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(data, separators=(',', ':'))
+
+
+def _loads(text: str) -> Any:
+    """Deserialize JSON with orjson when available, stdlib otherwise."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting sustained request rate.
+
+    Tokens refill continuously at `rate_per_minute`; acquire() blocks until
+    a token is available, smoothing bursts below the provider's rate limit
+    instead of triggering 429s and backoff penalties.
+    """
+
+    def __init__(self, rate_per_minute: int, capacity: Optional[int] = None):
+        """
+        Args:
+            rate_per_minute: Sustained refill rate (requests per minute)
+            capacity: Maximum burst size (defaults to one second of refill,
+                minimum 1)
+        """
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1, int(self.rate_per_second))
+        self._tokens = float(self.capacity)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._last_refill) * self.rate_per_second
+                )
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate_per_second
+            time.sleep(wait)
+
+
+def _parse_json_response(text: str, default: Any = None) -> Any:
+    """
+    Parse JSON out of an LLM response, stripping Markdown code fences.
+
+    Args:
+        text: Raw LLM response text
+        default: Value returned when no JSON can be decoded
+
+    Returns:
+        Decoded JSON value, or default
+    """
+    cleaned = _JSON_FENCE.sub('', text.strip()).strip()
+    try:
+        return _loads(cleaned)
+    except ValueError:
+        # Fall back to the first decodable JSON value inside the text
+        for opener in ('{', '['):
+            idx = cleaned.find(opener)
+            if idx >= 0:
+                try:
+                    return json.JSONDecoder().raw_decode(cleaned[idx:])[0]
+                except json.JSONDecodeError:
+                    continue
+        return default
+
 
 class LLMService:
     """Service for interacting with OpenRouter LLM API."""
     
-    def __init__(self, api_key: str, model: str = "openai/gpt-4o-mini"):
+    # Maximum entries kept in the in-memory response cache
+    CACHE_MAX_ENTRIES = 4096
+
+    # How long a failing model is skipped before being tried again
+    FAILOVER_COOLDOWN_SECONDS = 60.0
+
+    def __init__(self, api_key: str, model: str = "openai/gpt-4o-mini",
+                 cache_path: Optional[str] = None, qpm: int = 500,
+                 concurrency: int = 50,
+                 fallback_models: Optional[List[str]] = None):
         """
         Initialize LLM service.
-        
+
         Args:
             api_key: OpenRouter API key
             model: Model to use (default: gpt-4o-mini)
+            cache_path: Optional JSONL file persisting the response cache
+                across runs
+            qpm: Sustained request rate cap (queries per minute)
+            concurrency: Maximum requests in flight at once
+            fallback_models: Models tried in order when the primary fails
+                after transport-level retries; a failing model is put on a
+                short cool-down so subsequent calls skip straight to a
+                healthy one
         """
         self.api_key = api_key
         self.model = model
         self.base_url = "https://openrouter.ai/api/v1/chat/completions"
+        self.models = [model] + list(fallback_models or [])
+        # model -> monotonic time until which it is considered unhealthy
+        self._cooldown_until = {}
+        self._cooldown_lock = threading.Lock()
+
+        # Persistent session: keep-alive reuses the TLS connection across
+        # calls instead of paying a TCP+TLS handshake per request.
+        # Transient failures (429, 5xx, dropped connections) are retried at
+        # the transport layer with exponential backoff and jitter; POST must
+        # be allowed explicitly since Retry skips it by default. Retry-After
+        # headers on 429s are honored, so the static severity-map fallback
+        # only kicks in once retries are exhausted.
+        retry = Retry(
+            total=5,
+            backoff_factor=1.0,
+            backoff_jitter=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset({'POST'}),
+            respect_retry_after_header=True
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32,
+                                                   max_retries=retry))
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://github.com/your-repo",  # Optional
+            "X-Title": "IT Resource Event Processor"  # Optional
+        })
+
+        # Rate limiting: the bucket smooths sustained throughput under the
+        # provider's per-minute limit, the semaphore caps in-flight requests
+        self._bucket = TokenBucket(qpm)
+        self._sem = threading.Semaphore(concurrency)
+
+        # Exact-match response cache: repeated prompts skip the network
+        # entirely. call_many drives _call_llm from worker threads, so every
+        # get/move_to_end/insert/evict sequence runs under this lock
+        self.cache_path = cache_path
+        self._response_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._load_response_cache()
+
+    def _load_response_cache(self):
+        """Load persisted cache entries from the JSONL sidecar, if configured."""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = _loads(line)
+                        self._response_cache[entry['key']] = entry['response']
+                    except (ValueError, KeyError):
+                        continue
+        except IOError:
+            pass
+
+    def _cache_response(self, key: str, response: str):
+        """Store a response in the LRU cache and append it to the sidecar."""
+        with self._cache_lock:
+            self._response_cache[key] = response
+            self._response_cache.move_to_end(key)
+            while len(self._response_cache) > self.CACHE_MAX_ENTRIES:
+                self._response_cache.popitem(last=False)
+        if self.cache_path:
+            try:
+                with open(self.cache_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'key': key, 'response': response}) + '\n')
+            except IOError:
+                pass
+
+    @staticmethod
+    def _cache_key(model: str, system_prompt: Optional[str], prompt: str) -> str:
+        """Hash of (model, system_prompt, prompt) identifying a cached call."""
+        payload = '\x1f'.join((model, system_prompt or '', prompt))
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
     
-    def _call_llm(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+    def _call_llm(self, prompt: str, system_prompt: Optional[str] = None,
+                  stream: bool = False) -> str:
         """
         Call OpenRouter LLM API.
-        
+
         Args:
             prompt: User prompt
             system_prompt: Optional system prompt
-            
+            stream: Consume the response as Server-Sent Events, assembling
+                content as it is generated instead of blocking on the full
+                completion (worthwhile for long-form outputs)
+
         Returns:
             LLM response text
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://github.com/your-repo",  # Optional
-            "X-Title": "IT Resource Event Processor"  # Optional
-        }
-        
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": prompt})
-        
+
         payload = {
             "model": self.model,
             "messages": messages,
             "temperature": 0.3  # Lower temperature for more consistent results
         }
-        
-        try:
-            response = requests.post(self.base_url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            result = response.json()
-            return result['choices'][0]['message']['content']
-        except Exception as e:
-            print(f"Error calling LLM: {e}")
-            return ""
+        if stream:
+            payload["stream"] = True
+
+        last_error = None
+        for model in self._healthy_models():
+            # Cache keys carry the model actually being asked, so a response
+            # served by a fallback is never stored (or found) under the
+            # primary's key
+            cache_key = self._cache_key(model, system_prompt, prompt)
+            with self._cache_lock:
+                cached = self._response_cache.get(cache_key)
+                if cached is not None:
+                    self._response_cache.move_to_end(cache_key)
+                    return cached
+            payload["model"] = model
+            try:
+                with self._sem:
+                    self._bucket.acquire()
+                    response = self.session.post(self.base_url, json=payload,
+                                                 stream=stream, timeout=30)
+                    response.raise_for_status()
+                    if stream:
+                        content = self._consume_sse(response)
+                    else:
+                        content = response.json()['choices'][0]['message']['content']
+                if content:
+                    self._cache_response(cache_key, content)
+                return content
+            except Exception as e:
+                # Transport-level retries are already exhausted at this
+                # point; cool the model down and fail over to the next one
+                last_error = e
+                with self._cooldown_lock:
+                    self._cooldown_until[model] = time.monotonic() + self.FAILOVER_COOLDOWN_SECONDS
+
+        print(f"Error calling LLM: {last_error}")
+        return ""
+
+    def _healthy_models(self) -> List[str]:
+        """Configured models with cooled-down ones filtered out (all of them,
+        if every model is cooling down)."""
+        with self._cooldown_lock:
+            now = time.monotonic()
+            healthy = [m for m in self.models if self._cooldown_until.get(m, 0) <= now]
+        return healthy or list(self.models)
+
+    @staticmethod
+    def _consume_sse(response) -> str:
+        """Assemble streamed completion content from SSE `data:` chunks."""
+        parts = []
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+            try:
+                delta = _loads(data)['choices'][0].get('delta', {})
+            except (ValueError, KeyError, IndexError):
+                continue
+            chunk = delta.get('content')
+            if chunk:
+                parts.append(chunk)
+        return ''.join(parts)
     
+    def call_many(self, prompts: List[Dict[str, Any]], max_workers: int = 8) -> List[str]:
+        """
+        Execute many LLM calls concurrently over the pooled session.
+
+        Intended for non-interactive (scheduled) work where only completion
+        matters, not per-call latency.
+
+        Args:
+            prompts: List of dicts with 'prompt' and optional 'system_prompt'
+            max_workers: Concurrency cap
+
+        Returns:
+            Responses in the same order as the input list
+        """
+        if not prompts:
+            return []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(
+                lambda p: self._call_llm(p['prompt'], p.get('system_prompt')),
+                prompts
+            ))
+
+    def run_batch_file(self, input_path: str, output_path: str, max_workers: int = 8):
+        """
+        Run a JSONL batch of chat requests and write a JSONL result file.
+
+        Input lines follow the OpenAI Batch API request format:
+        {"custom_id": ..., "body": {"messages": [...], ...}}. Each output
+        line is {"custom_id": ..., "response": <content>}. OpenRouter has no
+        hosted batch endpoint, so the requests are executed concurrently
+        through the regular completions endpoint.
+
+        Args:
+            input_path: Path to JSONL request file
+            output_path: Path to JSONL result file to write
+            max_workers: Concurrency cap
+        """
+        requests_list = []
+        with open(input_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    requests_list.append(json.loads(line))
+
+        prompts = []
+        for request in requests_list:
+            messages = request.get('body', {}).get('messages', [])
+            system_prompt = None
+            prompt = ''
+            for message in messages:
+                if message.get('role') == 'system':
+                    system_prompt = message.get('content')
+                elif message.get('role') == 'user':
+                    prompt = message.get('content', '')
+            prompts.append({'prompt': prompt, 'system_prompt': system_prompt})
+
+        responses = self.call_many(prompts, max_workers=max_workers)
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for request, response in zip(requests_list, responses):
+                f.write(json.dumps({
+                    'custom_id': request.get('custom_id'),
+                    'response': response
+                }) + '\n')
+
     def predict_failure_probability(self, resource_type: str, event: Dict[str, Any]) -> float:
         """
         Predict probability of future failures for a resource based on an event.
@@ -73,7 +409,12 @@ class LLMService:
         """
         event_type = event.get('event_type', 'unknown')
         duration = event.get('duration_event', '0')
-        
+
+        # Deterministic event types are answered from the severity map
+        # without spending an LLM call
+        if event_type in _DETERMINISTIC_EVENT_TYPES:
+            return _SEVERITY_MAP[event_type]
+
         system_prompt = """You are an IT infrastructure expert analyzing events to predict failure probabilities.
 Analyze the event and provide a failure probability score between 0.0 and 1.0.
 Consider the event type, resource type, and duration when making your assessment.
@@ -92,34 +433,91 @@ Based on this event, what is the probability (0.0 to 1.0) that this resource wil
 Provide your response as a JSON object with 'probability' and 'reasoning' fields."""
 
         response = self._call_llm(prompt, system_prompt)
-        
+
+        result = _parse_json_response(response)
         try:
-            # Try to extract JSON from response
-            response = response.strip()
-            if response.startswith('```json'):
-                response = response[7:]
-            if response.startswith('```'):
-                response = response[3:]
-            if response.endswith('```'):
-                response = response[:-3]
-            response = response.strip()
-            
-            result = json.loads(response)
             probability = float(result.get('probability', 0.5))
             return max(0.0, min(1.0, probability))  # Clamp between 0 and 1
-        except (json.JSONDecodeError, ValueError, KeyError):
-            # Default probability based on event type severity
-            severity_map = {
-                'hardware_failure': 0.9,
-                'operating_system_failure': 0.8,
-                'software_service_failure': 0.6,
-                'cpu_overflow': 0.5,
-                'hardware_maintenance_stop': 0.2,
-                'software_maintenance_stop': 0.1,
-                'software_update': 0.1,
-                'operating_system_update': 0.2
+        except (ValueError, TypeError, AttributeError):
+            return self._default_failure_probability(event_type)
+
+    @staticmethod
+    def _default_failure_probability(event_type: str) -> float:
+        """Fallback probability based on event type severity."""
+        return _SEVERITY_MAP.get(event_type, 0.3)
+
+    def predict_failure_probabilities_batch(self, resource_type: str,
+                                            events: List[Dict[str, Any]]) -> List[float]:
+        """
+        Predict failure probabilities for all events of a resource in one call.
+
+        Sends the whole event list in a single chat completion instead of one
+        request per event, amortizing the HTTP round-trip and prompt prefix.
+
+        Args:
+            resource_type: Type of resource (server, workstation, automate, internet_gateway)
+            events: List of event data dictionaries
+
+        Returns:
+            Failure probabilities (floats between 0 and 1), one per event,
+            in the same order as the input list
+        """
+        if not events:
+            return []
+
+        # Deterministic event types never reach the LLM; only the uncertain
+        # remainder is sent in the batched prompt
+        uncertain_events = [
+            event for event in events
+            if event.get('event_type', 'unknown') not in _DETERMINISTIC_EVENT_TYPES
+        ]
+        if not uncertain_events:
+            return [_SEVERITY_MAP[event.get('event_type')] for event in events]
+
+        system_prompt = """You are an IT infrastructure expert analyzing events to predict failure probabilities.
+For EACH event in the provided JSON array, provide a failure probability score between 0.0 and 1.0.
+Consider the event type, resource type, and duration when making your assessment.
+Respond with ONLY a JSON array of objects, each containing 'event_id', 'probability' (float) and 'reasoning' (string)."""
+
+        event_summaries = [
+            {
+                'event_id': event.get('event_id'),
+                'event_type': event.get('event_type', 'unknown'),
+                'duration_seconds': event.get('duration_event', '0'),
+                'start_time': event.get('timestamp_start_event'),
+                'end_time': event.get('timestamp_end_event')
             }
-            return severity_map.get(event_type, 0.3)
+            for event in uncertain_events
+        ]
+
+        prompt = f"""Analyze these IT resource events and predict the probability of future failures for each:
+
+Resource Type: {resource_type}
+Events: {_prompt_json(event_summaries)}
+
+For each event, what is the probability (0.0 to 1.0) that this resource will experience future failures?
+Respond as a JSON array of objects with 'event_id', 'probability' and 'reasoning' fields."""
+
+        response = self._call_llm(prompt, system_prompt)
+
+        probability_by_id = {}
+        try:
+            for entry in _parse_json_response(response, default=[]):
+                probability_by_id[entry.get('event_id')] = float(entry.get('probability', 0.5))
+        except (ValueError, TypeError, AttributeError):
+            pass
+
+        probabilities = []
+        for event in events:
+            event_type = event.get('event_type', 'unknown')
+            if event_type in _DETERMINISTIC_EVENT_TYPES:
+                probability = _SEVERITY_MAP[event_type]
+            else:
+                probability = probability_by_id.get(event.get('event_id'))
+                if probability is None:
+                    probability = self._default_failure_probability(event_type)
+            probabilities.append(max(0.0, min(1.0, probability)))
+        return probabilities
     
     def evaluate_carbon_footprint(self, energy_data: Dict[str, Any], events: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -140,7 +538,7 @@ Respond with a JSON object containing 'total_co2_kg', 'co2_by_resource_type', an
         
         prompt = f"""Evaluate the carbon footprint for IT resources based on this energy consumption data:
 
-{json.dumps(energy_data, indent=2)}
+{_prompt_json(energy_data)}
 
 Consider that:
 - Energy consumption is measured in watt-hours
@@ -154,39 +552,25 @@ Provide a detailed carbon footprint evaluation as JSON with:
 - 'methodology': explanation of calculation method"""
 
         response = self._call_llm(prompt, system_prompt)
-        
-        try:
-            response = response.strip()
-            if response.startswith('```json'):
-                response = response[7:]
-            if response.startswith('```'):
-                response = response[3:]
-            if response.endswith('```'):
-                response = response[:-3]
-            response = response.strip()
-            
-            result = json.loads(response)
+
+        result = _parse_json_response(response)
+        if isinstance(result, dict):
             return result
-        except (json.JSONDecodeError, ValueError):
-            # Fallback calculation
-            return self._fallback_carbon_calculation(energy_data)
+        # Fallback calculation
+        return self._fallback_carbon_calculation(energy_data)
     
     def _fallback_carbon_calculation(self, energy_data: Dict[str, Any]) -> Dict[str, Any]:
         """Fallback carbon calculation if LLM fails."""
-        total_wh = energy_data.get('total_energy_wh', 0)
-        total_kwh = total_wh / 1000.0
         co2_per_kwh = 0.5  # kg CO2 per kWh
-        total_co2 = total_kwh * co2_per_kwh
-        
-        co2_by_type = {}
-        for resource_type in ['server', 'workstation', 'automate', 'internet_gateway']:
-            wh = energy_data.get('energy_by_type', {}).get(resource_type, 0)
-            kwh = wh / 1000.0
-            co2_by_type[resource_type] = kwh * co2_per_kwh
-        
+        wh_to_co2 = co2_per_kwh / 1000.0
+        energy_by_type = energy_data.get('energy_by_type', {})
+
         return {
-            'total_co2_kg': round(total_co2, 2),
-            'co2_by_resource_type': {k: round(v, 2) for k, v in co2_by_type.items()},
+            'total_co2_kg': round(energy_data.get('total_energy_wh', 0) * wh_to_co2, 2),
+            'co2_by_resource_type': {
+                resource_type: round(energy_by_type.get(resource_type, 0) * wh_to_co2, 2)
+                for resource_type in ['server', 'workstation', 'automate', 'internet_gateway']
+            },
             'methodology': 'Standard calculation: energy (kWh) × 0.5 kg CO2/kWh'
         }
     
@@ -210,10 +594,10 @@ Respond with a JSON object containing 'summary', 'key_findings', 'recommendation
         prompt = f"""Create a comprehensive CO2 emission report summary based on this data:
 
 Energy Consumption Data:
-{json.dumps(energy_data, indent=2)}
+{_prompt_json(energy_data)}
 
 Carbon Footprint Data:
-{json.dumps(carbon_data, indent=2)}
+{_prompt_json(carbon_data)}
 
 Generate a professional report with:
 - 'summary': Executive summary paragraph
@@ -223,28 +607,18 @@ Generate a professional report with:
 
 Respond as JSON."""
 
-        response = self._call_llm(prompt, system_prompt)
-        
-        try:
-            response = response.strip()
-            if response.startswith('```json'):
-                response = response[7:]
-            if response.startswith('```'):
-                response = response[3:]
-            if response.endswith('```'):
-                response = response[:-3]
-            response = response.strip()
-            
-            result = json.loads(response)
+        response = self._call_llm(prompt, system_prompt, stream=True)
+
+        result = _parse_json_response(response)
+        if isinstance(result, dict):
             return result
-        except (json.JSONDecodeError, ValueError):
-            # Fallback report
-            return {
-                'summary': f"Total CO2 emissions: {carbon_data.get('total_co2_kg', 0)} kg",
-                'key_findings': ['Energy consumption calculated based on resource types and events'],
-                'recommendations': ['Monitor resource usage', 'Optimize energy consumption'],
-                'details': carbon_data.get('co2_by_resource_type', {})
-            }
+        # Fallback report
+        return {
+            'summary': f"Total CO2 emissions: {carbon_data.get('total_co2_kg', 0)} kg",
+            'key_findings': ['Energy consumption calculated based on resource types and events'],
+            'recommendations': ['Monitor resource usage', 'Optimize energy consumption'],
+            'details': carbon_data.get('co2_by_resource_type', {})
+        }
     
     def generate_co2_reduction_advice(self, energy_data: Dict[str, Any], carbon_data: Dict[str, Any],
                                      resource_details: List[Dict[str, Any]]) -> List[str]:
@@ -274,8 +648,8 @@ to provide 3 specific, practical, and actionable recommendations. Focus on the a
             'resources_with_failures': []
         }
         
-        # Find resources with highest CO2 emissions
-        sorted_resources = sorted(resource_details, key=lambda x: x['co2_kg'], reverse=True)
+        # Find resources with highest CO2 emissions: a partial sort keeps
+        # only the top 5 instead of ordering the full list
         resource_summary['resources_with_high_co2'] = [
             {
                 'id': r['id'],
@@ -283,11 +657,10 @@ to provide 3 specific, practical, and actionable recommendations. Focus on the a
                 'co2_kg': r['co2_kg'],
                 'energy_kwh': r['energy_kwh']
             }
-            for r in sorted_resources[:5]  # Top 5 highest CO2 emitters
+            for r in heapq.nlargest(5, resource_details, key=lambda x: x['co2_kg'])
         ]
-        
+
         # Find resources with high failure probability
-        resources_with_failures = [r for r in resource_details if r['failure_probability'] > 0.3]
         resource_summary['resources_with_failures'] = [
             {
                 'id': r['id'],
@@ -295,7 +668,11 @@ to provide 3 specific, practical, and actionable recommendations. Focus on the a
                 'failure_probability': r['failure_probability'],
                 'co2_kg': r['co2_kg']
             }
-            for r in sorted(resources_with_failures, key=lambda x: x['failure_probability'], reverse=True)[:5]
+            for r in heapq.nlargest(
+                5,
+                (r for r in resource_details if r['failure_probability'] > 0.3),
+                key=lambda x: x['failure_probability']
+            )
         ]
         
         prompt = f"""Based on the following IT infrastructure CO2 emission analysis, provide exactly 3 specific, 
@@ -304,14 +681,14 @@ actionable recommendations to reduce CO2 emissions. Focus on the actual resource
 Current Infrastructure:
 - Total CO2 Emissions: {resource_summary['total_co2_kg']:.2f} kg
 - Total Energy Consumption: {resource_summary['total_energy_kwh']:.2f} kWh
-- Production Inventory: {json.dumps(resource_summary['production_inventory'], indent=2)}
-- CO2 by Resource Type: {json.dumps(resource_summary['co2_by_resource_type'], indent=2)}
+- Production Inventory: {_prompt_json(resource_summary['production_inventory'])}
+- CO2 by Resource Type: {_prompt_json(resource_summary['co2_by_resource_type'])}
 
 Top CO2 Emitting Resources:
-{json.dumps(resource_summary['resources_with_high_co2'], indent=2)}
+{_prompt_json(resource_summary['resources_with_high_co2'])}
 
 Resources with High Failure Probability:
-{json.dumps(resource_summary['resources_with_failures'], indent=2)}
+{_prompt_json(resource_summary['resources_with_failures'])}
 
 Provide exactly 3 specific, actionable recommendations. Each recommendation should:
 1. Be specific to the actual resources and their current consumption
@@ -321,33 +698,20 @@ Provide exactly 3 specific, actionable recommendations. Each recommendation shou
 
 Respond with a JSON object containing a 'advices' field which is an array of exactly 3 strings, each being one recommendation."""
 
-        response = self._call_llm(prompt, system_prompt)
-        
-        try:
-            response = response.strip()
-            if response.startswith('```json'):
-                response = response[7:]
-            if response.startswith('```'):
-                response = response[3:]
-            if response.endswith('```'):
-                response = response[:-3]
-            response = response.strip()
-            
-            result = json.loads(response)
-            advices = result.get('advices', [])
-            
-            # Ensure we have exactly 3 advices
-            if len(advices) >= 3:
-                return advices[:3]
-            elif len(advices) > 0:
-                # Pad with generic advice if needed
-                while len(advices) < 3:
-                    advices.append("Monitor and optimize energy consumption patterns.")
-                return advices
-            else:
-                # Fallback advices
-                return self._fallback_co2_advice(resource_summary)
-        except (json.JSONDecodeError, ValueError, KeyError):
+        response = self._call_llm(prompt, system_prompt, stream=True)
+
+        result = _parse_json_response(response)
+        advices = result.get('advices', []) if isinstance(result, dict) else []
+
+        # Ensure we have exactly 3 advices
+        if len(advices) >= 3:
+            return advices[:3]
+        elif len(advices) > 0:
+            # Pad with generic advice if needed
+            while len(advices) < 3:
+                advices.append("Monitor and optimize energy consumption patterns.")
+            return advices
+        else:
             # Fallback advices
             return self._fallback_co2_advice(resource_summary)
     
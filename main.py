@@ -4,9 +4,20 @@ Main application for IT resource event processing and CO2 emission reporting.
 
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, Any
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from llm_service import LLMService
 from energy_calculator import EnergyCalculator
 from database import Database
@@ -15,6 +26,9 @@ from report_generator import ReportGenerator
 
 class ResourceEventProcessor:
     """Main processor for resource events."""
+
+    # Cap on concurrent LLM calls; each call is network-bound for 1-3s
+    MAX_CONCURRENT_LLM_CALLS = 8
     
     def __init__(self, openrouter_api_key: str, database_path: str = "events_database.json"):
         """
@@ -37,51 +51,141 @@ class ResourceEventProcessor:
             input_file: Path to input JSON file
         """
         print(f"Loading input file: {input_file}")
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        print(f"Processing {len(data)} resources...")
-        
-        # Process each resource
-        for resource_id, resource_data in data.items():
-            resource_type = resource_data.get('type')
-            events = resource_data.get('events', [])
-            
-            print(f"\nProcessing {resource_id} (type: {resource_type}) with {len(events)} events")
-            
-            # Analyze each event with LLM for failure prediction
+
+        # Predictions already checkpointed by an interrupted earlier run are
+        # reused instead of spending LLM calls on them again
+        checkpoint_path = input_file + '.predictions.jsonl'
+        done = self._load_checkpoint(checkpoint_path)
+        if done:
+            print(f"Resuming: {len(done)} predictions restored from checkpoint")
+
+        # Analyze events with LLM for failure prediction: one batched call per
+        # resource, overlapped across a bounded worker pool. Resources are
+        # submitted as they stream off the parser, so network calls start
+        # before the file has been fully read.
+        tasks = []
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_LLM_CALLS) as executor:
+            for resource_id, resource_data in self._iter_resources(input_file):
+                resource_type = resource_data.get('type')
+                events = resource_data.get('events', [])
+
+                print(f"\nProcessing {resource_id} (type: {resource_type}) with {len(events)} events")
+
+                # Only events without a checkpointed prediction go to the LLM
+                new_events = [e for e in events if e.get('event_id') not in done]
+                tasks.append((resource_id, resource_type, events, new_events))
+                futures.append(executor.submit(
+                    self.llm_service.predict_failure_probabilities_batch,
+                    resource_type, new_events
+                ) if new_events else None)
+
+            print(f"\nAnalyzing events for {len(tasks)} resources...")
+
+            # Checkpoint each resource's predictions as its future resolves,
+            # so a crash mid-run loses at most the in-flight calls
+            results = []
+            with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+                for (_, _, _, new_events), future in zip(tasks, futures):
+                    probabilities = future.result() if future is not None else []
+                    results.append(probabilities)
+                    for event, probability in zip(new_events, probabilities):
+                        checkpoint.write(json.dumps({
+                            'event_id': event.get('event_id'),
+                            'probability': probability
+                        }) + '\n')
+                    checkpoint.flush()
+
+        # Collect all annotated events and insert them in one bulk call
+        pending = []
+        for (resource_id, resource_type, events, new_events), probabilities in zip(tasks, results):
+            fresh = {id(e): p for e, p in zip(new_events, probabilities)}
             for event in events:
-                print(f"  Analyzing event {event.get('event_id')}...")
-                failure_probability = self.llm_service.predict_failure_probability(
-                    resource_type, event
-                )
-                event['failure_probability'] = failure_probability
-                
-                # Store event in database
-                self.database.add_event(resource_id, resource_type, event)
-        
+                if id(event) in fresh:
+                    event['failure_probability'] = fresh[id(event)]
+                else:
+                    event['failure_probability'] = done[event.get('event_id')]
+                pending.append((resource_id, resource_type, event))
+
+        self.database.add_events_bulk(pending)
+
         # Save database
         self.database.save()
+
+        # Predictions are durable in the database now; the checkpoint has
+        # served its purpose
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
         print("\nEvents stored in database.")
-    
-    def generate_co2_report(self, output_file: str = "CO2_emission_report.json"):
+
+    @staticmethod
+    def _load_checkpoint(checkpoint_path: str) -> Dict[str, float]:
         """
-        Generate CO2 emission report for the last week.
-        
+        Load checkpointed predictions from an interrupted run.
+
         Args:
-            output_file: Path to output JSON report file
+            checkpoint_path: Path to the predictions JSONL sidecar
+
+        Returns:
+            Mapping of event_id to predicted failure probability
+        """
+        done = {}
+        if not os.path.exists(checkpoint_path):
+            return done
+        try:
+            with open(checkpoint_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                        done[entry['event_id']] = entry['probability']
+                    except (json.JSONDecodeError, KeyError):
+                        # Truncated trailing record from a crash mid-write
+                        continue
+        except IOError:
+            pass
+        return done
+
+    @staticmethod
+    def _iter_resources(input_file: str):
+        """
+        Yield (resource_id, resource_data) pairs from the input JSON file.
+
+        Streams via ijson when it is installed, keeping memory flat for
+        large dumps; otherwise loads the whole file with the stdlib parser.
+
+        Args:
+            input_file: Path to input JSON file
+        """
+        if ijson is not None:
+            with open(input_file, 'rb') as f:
+                yield from ijson.kvitems(f, '')
+        elif orjson is not None:
+            with open(input_file, 'rb') as f:
+                yield from orjson.loads(f.read()).items()
+        else:
+            with open(input_file, 'r', encoding='utf-8') as f:
+                yield from json.load(f).items()
+
+    def build_co2_report(self) -> Dict[str, Any]:
+        """
+        Build the CO2 emission report for the last week in memory.
+
+        Returns:
+            Report dictionary, including the textual report under
+            'textual_report'
         """
         print("\nGenerating CO2 emission report for the last week...")
         
-        # Get events from database
-        all_events = self.database.get_all_events()
-        
         # Calculate end date (now) and start date (7 days ago)
         end_date = datetime.now()
         start_date = end_date - timedelta(days=7)
-        
-        # Filter events from last week
-        week_events = self._filter_events_by_date_range(all_events, start_date, end_date)
+
+        # Query events from last week directly; the database filters on
+        # precomputed epochs instead of re-parsing every timestamp
+        week_events = self.database.get_events_in_range(start_date, end_date)
         
         # Calculate energy consumption and carbon footprint
         print("Calculating energy consumption and carbon footprint...")
@@ -99,63 +203,49 @@ class ResourceEventProcessor:
         
         # Generate textual report
         print("Generating textual report...")
-        textual_report = self.report_generator.generate_textual_report(
+        report['textual_report'] = self.report_generator.generate_textual_report(
             energy_data, carbon_footprint, week_events, self.database
         )
-        
+
+        return report
+
+    def write_co2_report(self, report: Dict[str, Any], output_file: str = "CO2_emission_report.json"):
+        """
+        Write a built report to JSON and textual output files.
+
+        Args:
+            report: Report dictionary from build_co2_report
+            output_file: Path to output JSON report file
+        """
+        textual_report = report.get('textual_report', '')
+        json_report = {k: v for k, v in report.items() if k != 'textual_report'}
+
         # Save JSON report
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(report, f, indent=2, ensure_ascii=False)
-        
+            json.dump(json_report, f, indent=2, ensure_ascii=False)
+
         # Save textual report
         textual_output_file = output_file.replace('.json', '_textual.txt')
         with open(textual_output_file, 'w', encoding='utf-8') as f:
             f.write(textual_report)
-        
+
         print(f"\nCO2 emission report (JSON) saved to: {output_file}")
         print(f"CO2 emission report (Textual) saved to: {textual_output_file}")
-        
-        # Also add textual report to JSON
-        report['textual_report'] = textual_report
-        
-        return report
-    
-    def _filter_events_by_date_range(self, events: Dict, start_date: datetime, end_date: datetime) -> Dict:
-        """Filter events by date range."""
-        filtered = {}
-        
-        for resource_id, resource_data in events.items():
-            filtered_events = []
-            for event in resource_data.get('events', []):
-                try:
-                    timestamp_str = event.get('timestamp_start_event', '')
-                    if not timestamp_str:
-                        continue
-                    
-                    # Handle ISO format with or without timezone
-                    if timestamp_str.endswith('Z'):
-                        timestamp_str = timestamp_str[:-1] + '+00:00'
-                    
-                    event_start = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                    # Remove timezone for comparison if present
-                    if event_start.tzinfo:
-                        event_start = event_start.replace(tzinfo=None)
-                    
-                    if start_date <= event_start <= end_date:
-                        filtered_events.append(event)
-                except (ValueError, TypeError) as e:
-                    # Skip events with invalid timestamps
-                    continue
-            
-            if filtered_events:
-                filtered[resource_id] = {
-                    'type': resource_data.get('type'),
-                    'events': filtered_events
-                }
-        
-        return filtered
 
+    def generate_co2_report(self, output_file: str = "CO2_emission_report.json") -> Dict[str, Any]:
+        """
+        Generate CO2 emission report for the last week and write it to disk.
+
+        Args:
+            output_file: Path to output JSON report file
 
+        Returns:
+            Report dictionary
+        """
+        report = self.build_co2_report()
+        self.write_co2_report(report, output_file)
+        return report
+    
 def main():
     """Main entry point."""
     import argparse
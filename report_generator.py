@@ -2,7 +2,10 @@
 Report generator for CO2 emissions.
 """
 
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta
+from io import StringIO
+from operator import itemgetter
 from typing import Dict, Any, List
 
 
@@ -36,19 +39,15 @@ class ReportGenerator:
         # Generate summary using LLM
         llm_summary = self.llm_service.generate_report_summary(energy_data, carbon_data, events)
         
-        # Count resources by type
+        # Count resources by type in a single pass
+        type_counts = Counter(
+            resource_data.get('type') for resource_data in events.values()
+        )
         resource_counts = {
-            'server': 0,
-            'workstation': 0,
-            'automate': 0,
-            'internet_gateway': 0
+            resource_type: type_counts.get(resource_type, 0)
+            for resource_type in ['server', 'workstation', 'automate', 'internet_gateway']
         }
-        
-        for resource_id, resource_data in events.items():
-            resource_type = resource_data.get('type')
-            if resource_type in resource_counts:
-                resource_counts[resource_type] += 1
-        
+
         # Build comprehensive report
         report = {
             'report_metadata': {
@@ -69,7 +68,7 @@ class ReportGenerator:
             'recommendations': llm_summary.get('recommendations', []),
             'detailed_breakdown': {
                 'by_resource_type': self._generate_type_breakdown(
-                    energy_data, carbon_data, events
+                    energy_data, carbon_data, resource_counts
                 ),
                 'methodology': carbon_data.get('methodology', 'Standard CO2 calculation')
             },
@@ -79,43 +78,40 @@ class ReportGenerator:
         return report
     
     def _generate_type_breakdown(self, energy_data: Dict[str, Any], carbon_data: Dict[str, Any],
-                                 events: Dict[str, Any]) -> Dict[str, Any]:
+                                 resource_counts: Dict[str, int]) -> Dict[str, Any]:
         """
         Generate detailed breakdown by resource type.
-        
+
         Args:
             energy_data: Energy consumption data
             carbon_data: Carbon footprint data
-            events: Events data
-            
+            resource_counts: Number of resources with events per type
+
         Returns:
             Breakdown dictionary
         """
         breakdown = {}
-        
+
         co2_by_type = carbon_data.get('co2_by_resource_type', {})
         energy_by_type = energy_data.get('energy_by_type', {})
-        energy_by_resource = energy_data.get('energy_by_resource', {})
-        
+
+        # Group per-resource energy entries by type in one pass
+        resources_by_type = defaultdict(dict)
+        for rid, rdata in energy_data.get('energy_by_resource', {}).items():
+            resources_by_type[rdata.get('type')][rid] = rdata
+
         for resource_type in ['server', 'workstation', 'automate', 'internet_gateway']:
-            # Count resources of this type
-            count = sum(1 for r in events.values() if r.get('type') == resource_type)
-            
-            # Get resources of this type
-            resources = {
-                rid: rdata for rid, rdata in energy_by_resource.items()
-                if rdata.get('type') == resource_type
-            }
-            
+            count = resource_counts.get(resource_type, 0)
+            co2_kg = co2_by_type.get(resource_type, 0)
+            energy_wh = energy_by_type.get(resource_type, 0)
+
             breakdown[resource_type] = {
                 'resource_count': count,
-                'total_co2_kg': co2_by_type.get(resource_type, 0),
-                'total_energy_kwh': round(energy_by_type.get(resource_type, 0) / 1000.0, 2),
-                'total_energy_wh': energy_by_type.get(resource_type, 0),
-                'average_co2_per_resource_kg': round(
-                    co2_by_type.get(resource_type, 0) / max(count, 1), 2
-                ),
-                'resources': resources
+                'total_co2_kg': co2_kg,
+                'total_energy_kwh': round(energy_wh / 1000.0, 2),
+                'total_energy_wh': energy_wh,
+                'average_co2_per_resource_kg': round(co2_kg / max(count, 1), 2),
+                'resources': dict(resources_by_type.get(resource_type, {}))
             }
         
         return breakdown
@@ -136,15 +132,27 @@ class ReportGenerator:
         """
         # Get all resources from database
         all_resources = database.get_all_events()
-        
+
         # Calculate CO2 per resource
         co2_per_kwh = 0.5  # kg CO2 per kWh
         production_inventory = energy_data.get('production_inventory', {})
         energy_by_resource = energy_data.get('energy_by_resource', {})
+
+        # One reporting window for every base-energy computation below.
+        # Evaluating datetime.now() inside the loops gave each call a
+        # slightly different window, which also defeated the calculator's
+        # per-(type, period) memoization; with fixed bounds there are at
+        # most four distinct base-energy computations per report. The same
+        # timestamp doubles as the report's generation time.
+        now = datetime.now()
+        end_date = now
+        start_date = end_date - timedelta(days=7)
         
-        # Build per-resource data
-        resource_details = []
-        
+        # Build per-resource data, bucketed by type up front so the report
+        # only needs one cheap sort per bucket instead of a global sort on
+        # a (type, -co2) tuple key
+        buckets = defaultdict(list)
+
         # Process resources with events
         for resource_id, resource_data in all_resources.items():
             resource_type = resource_data.get('type')
@@ -155,8 +163,6 @@ class ReportGenerator:
                 energy_wh = energy_by_resource[resource_id].get('adjusted_energy_wh', 0)
             else:
                 # Calculate base energy if not in events
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=7)
                 base_energy = self.energy_calculator._calculate_base_energy(
                     resource_type, start_date, end_date
                 )
@@ -172,7 +178,7 @@ class ReportGenerator:
             else:
                 avg_failure_prob = 0.0
             
-            resource_details.append({
+            buckets[resource_type].append({
                 'id': resource_id,
                 'type': resource_type,
                 'co2_kg': co2_kg,
@@ -180,38 +186,41 @@ class ReportGenerator:
                 'failure_probability': avg_failure_prob,
                 'events_count': len(resource_events)
             })
-        
+
         # Add resources without events (from production inventory)
         # Track existing resource IDs to avoid duplicates
-        existing_ids = {r['id'] for r in resource_details}
-        
+        existing_ids = set(all_resources)
+
+        # Count resources with events per type in a single pass
+        with_events_counts = Counter(r.get('type') for r in all_resources.values())
+
         for resource_type, count in production_inventory.items():
-            # Count how many of this type we have with events
-            resources_with_events = sum(1 for r in all_resources.values() if r.get('type') == resource_type)
-            resources_without_events = count - resources_with_events
+            resources_without_events = count - with_events_counts.get(resource_type, 0)
             
             if resources_without_events > 0:
                 # Calculate base energy for resources without events
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=7)
                 base_energy = self.energy_calculator._calculate_base_energy(
                     resource_type, start_date, end_date
                 )
                 energy_kwh = (base_energy / 1000.0)
                 co2_kg = energy_kwh * co2_per_kwh
-                
-                # Add entries for each resource without events
-                counter = 1
-                for i in range(resources_without_events):
-                    # Generate unique ID
-                    while True:
-                        resource_id = f"{resource_type}_{counter}"
-                        if resource_id not in existing_ids:
-                            existing_ids.add(resource_id)
-                            break
-                        counter += 1
-                    
-                    resource_details.append({
+
+                # Add entries for each resource without events, numbering
+                # past the highest existing "<type>_<n>" ID so each new ID
+                # is unique without rescanning the set
+                prefix = resource_type + '_'
+                used_numbers = {
+                    int(rid[len(prefix):]) for rid in existing_ids
+                    if rid.startswith(prefix) and rid[len(prefix):].isdigit()
+                }
+                next_number = max(used_numbers, default=0) + 1
+
+                for _ in range(resources_without_events):
+                    resource_id = f"{resource_type}_{next_number}"
+                    next_number += 1
+                    existing_ids.add(resource_id)
+
+                    buckets[resource_type].append({
                         'id': resource_id,
                         'type': resource_type,
                         'co2_kg': co2_kg,
@@ -219,94 +228,86 @@ class ReportGenerator:
                         'failure_probability': 0.0,
                         'events_count': 0
                     })
-                    counter += 1
-        
-        # Sort by resource type, then by CO2
-        resource_details.sort(key=lambda x: (x['type'], -x['co2_kg']))
-        
-        # Generate textual report
-        report_lines = []
-        report_lines.append("=" * 80)
-        report_lines.append("CO2 EMISSION REPORT - WEEKLY SUMMARY")
-        report_lines.append("=" * 80)
-        report_lines.append("")
-        
+
+        # Sort each bucket by CO2 descending; walking the buckets in type
+        # order then reproduces the old (type, -co2) global ordering
+        for bucket in buckets.values():
+            bucket.sort(key=itemgetter('co2_kg'), reverse=True)
+        resource_details = [
+            resource for resource_type in sorted(buckets)
+            for resource in buckets[resource_type]
+        ]
+
+        # Generate textual report, writing straight into a string buffer
+        # instead of accumulating a list of lines and joining at the end
+        buf = StringIO()
+        write = buf.write
+        write("=" * 80 + "\n")
+        write("CO2 EMISSION REPORT - WEEKLY SUMMARY\n")
+        write("=" * 80 + "\n\n")
+
         # Report metadata
         period = energy_data.get('period', {})
-        report_lines.append(f"Report Period: {period.get('start', 'N/A')} to {period.get('end', 'N/A')}")
-        report_lines.append(f"Generated At: {datetime.now().isoformat()}")
-        report_lines.append("")
-        
+        write(f"Report Period: {period.get('start', 'N/A')} to {period.get('end', 'N/A')}\n")
+        write(f"Generated At: {now.isoformat()}\n\n")
+
         # Executive summary
-        report_lines.append("-" * 80)
-        report_lines.append("EXECUTIVE SUMMARY")
-        report_lines.append("-" * 80)
+        write("-" * 80 + "\n")
+        write("EXECUTIVE SUMMARY\n")
+        write("-" * 80 + "\n")
         total_co2 = carbon_data.get('total_co2_kg', 0)
         total_energy = energy_data.get('total_energy_kwh', 0)
-        report_lines.append(f"Total CO2 Emissions: {total_co2:.2f} kg")
-        report_lines.append(f"Total Energy Consumption: {total_energy:.2f} kWh")
-        report_lines.append("")
-        
+        write(f"Total CO2 Emissions: {total_co2:.2f} kg\n")
+        write(f"Total Energy Consumption: {total_energy:.2f} kWh\n\n")
+
         # CO2 by resource category
-        report_lines.append("-" * 80)
-        report_lines.append("CO2 EMISSIONS BY RESOURCE CATEGORY")
-        report_lines.append("-" * 80)
+        write("-" * 80 + "\n")
+        write("CO2 EMISSIONS BY RESOURCE CATEGORY\n")
+        write("-" * 80 + "\n")
         co2_by_type = carbon_data.get('co2_by_resource_type', {})
         for resource_type in ['server', 'workstation', 'automate', 'internet_gateway']:
             co2 = co2_by_type.get(resource_type, 0)
             count = production_inventory.get(resource_type, 0)
-            report_lines.append(f"{resource_type.capitalize()}: {co2:.2f} kg CO2 ({count} resources)")
-        report_lines.append("")
-        
+            write(f"{resource_type.capitalize()}: {co2:.2f} kg CO2 ({count} resources)\n")
+        write("\n")
+
         # Per-resource details
-        report_lines.append("-" * 80)
-        report_lines.append("CO2 EMISSIONS AND FAILURE PROBABILITY PER RESOURCE")
-        report_lines.append("-" * 80)
-        report_lines.append("")
-        
-        # Group by resource type
-        current_type = None
-        for resource in resource_details:
-            if resource['type'] != current_type:
-                if current_type is not None:
-                    report_lines.append("")
-                current_type = resource['type']
-                report_lines.append(f"{current_type.upper()} Resources:")
-                report_lines.append("-" * 40)
-            
-            report_lines.append(
-                f"  {resource['id']:30s} | "
-                f"CO2: {resource['co2_kg']:8.2f} kg | "
-                f"Energy: {resource['energy_kwh']:8.2f} kWh | "
-                f"Failure Prob: {resource['failure_probability']:5.2%} | "
-                f"Events: {resource['events_count']}"
-            )
-        
-        report_lines.append("")
-        
+        write("-" * 80 + "\n")
+        write("CO2 EMISSIONS AND FAILURE PROBABILITY PER RESOURCE\n")
+        write("-" * 80 + "\n\n")
+
+        # Emit one block per type bucket; one format string shared by every
+        # row, and no per-row type comparison needed
+        detail_row = ("  {:30s} | CO2: {:8.2f} kg | Energy: {:8.2f} kWh | "
+                      "Failure Prob: {:5.2%} | Events: {}\n").format
+        for resource_type in sorted(buckets):
+            write(f"{resource_type.upper()} Resources:\n")
+            write("-" * 40 + "\n")
+            for resource in buckets[resource_type]:
+                write(detail_row(
+                    resource['id'], resource['co2_kg'], resource['energy_kwh'],
+                    resource['failure_probability'], resource['events_count']
+                ))
+            write("\n")
+
         # Generate CO2 reduction advice using LLM
-        report_lines.append("-" * 80)
-        report_lines.append("RECOMMENDATIONS TO REDUCE CO2 EMISSIONS")
-        report_lines.append("-" * 80)
-        report_lines.append("")
-        
+        write("-" * 80 + "\n")
+        write("RECOMMENDATIONS TO REDUCE CO2 EMISSIONS\n")
+        write("-" * 80 + "\n\n")
+
         try:
             advices = self.llm_service.generate_co2_reduction_advice(
                 energy_data, carbon_data, resource_details
             )
-            
+
             for i, advice in enumerate(advices, 1):
-                report_lines.append(f"{i}. {advice}")
-                report_lines.append("")
+                write(f"{i}. {advice}\n\n")
         except Exception as e:
             # Fallback if LLM fails
-            report_lines.append("1. Implement power management policies to reduce energy consumption during idle periods.")
-            report_lines.append("")
-            report_lines.append("2. Optimize resource utilization and consider virtualization to reduce physical hardware requirements.")
-            report_lines.append("")
-            report_lines.append("3. Monitor and maintain IT resources regularly to ensure optimal energy efficiency.")
-            report_lines.append("")
-        
-        report_lines.append("=" * 80)
-        
-        return "\n".join(report_lines)
+            write("1. Implement power management policies to reduce energy consumption during idle periods.\n\n")
+            write("2. Optimize resource utilization and consider virtualization to reduce physical hardware requirements.\n\n")
+            write("3. Monitor and maintain IT resources regularly to ensure optimal energy efficiency.\n\n")
+
+        write("=" * 80)
+
+        return buf.getvalue()
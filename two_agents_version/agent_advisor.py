@@ -1,8 +1,27 @@
 import json
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_loads(text):
+    """Parse JSON with orjson when available (3-10x faster), stdlib otherwise."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def json_dumps(obj, indent=False):
+    """Serialize to a JSON string with orjson when available, stdlib otherwise."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    return json.dumps(obj, indent=2 if indent else None)
+
 # Load environment variables
 load_dotenv()
 
@@ -13,11 +32,22 @@ MODEL_NAME = "meta-llama/llama-3.1-70b-instruct"
 SUMMARY_JSON = "summary_report.json"
 ADVICE_TXT = "advice_report.txt"
 
+# One session for all LLM calls: keep-alive avoids a fresh TCP+TLS
+# handshake per request, and transient 429/5xx responses are retried
+# with backoff at the transport layer
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10, pool_maxsize=10,
+    max_retries=Retry(total=3, backoff_factor=0.5,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=frozenset({"POST"}))
+))
+
 def get_llm_response(prompt, system_prompt="You are a helpful AI assistant."):
     if not OPENROUTER_API_KEY:
         print("Warning: OPENROUTER_API_KEY not found. Returning dummy response.")
         return "LLM Advice Unavailable: API Key missing."
-    
+
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json"
@@ -30,7 +60,8 @@ def get_llm_response(prompt, system_prompt="You are a helpful AI assistant."):
         ]
     }
     try:
-        response = requests.post(OPENROUTER_URL, headers=headers, json=data)
+        # (connect, read) timeout so a hung server cannot stall the agent
+        response = SESSION.post(OPENROUTER_URL, headers=headers, json=data, timeout=(5, 60))
         response.raise_for_status()
         return response.json()['choices'][0]['message']['content']
     except Exception as e:
@@ -43,7 +74,7 @@ def main():
         return
 
     with open(SUMMARY_JSON, 'r') as f:
-        summary_data = json.load(f)
+        summary_data = json_loads(f.read())
 
     print("Analyzing summary report for advice...")
     
@@ -60,7 +91,7 @@ def main():
     Analyze the following carbon footprint summary report.
     
     Top 3 High Consumption Resources (Focus Area):
-    {json.dumps(top_3_resources, indent=2)}
+    {json_dumps(top_3_resources, indent=True)}
     
     Global Stats:
     Total Energy: {summary_data.get("total_energy_wh")} Wh